@@ -0,0 +1,28 @@
+"""Convert the pickled irrigation model to ONNX for onnxruntime inference.
+
+Run after retraining (needs skl2onnx, which is not a runtime dependency):
+
+    pip install skl2onnx
+    python export_onnx.py
+"""
+import joblib
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+MODEL_PATH = "tamil_nadu_irrigation_model.pkl"
+ONNX_MODEL_PATH = "tamil_nadu_irrigation_model.onnx"
+
+artifacts = joblib.load(MODEL_PATH)
+model = artifacts['model']
+
+# Only the classifier is exported; feature building and scaling stay in main.py
+onx = convert_sklearn(
+    model,
+    initial_types=[('X', FloatTensorType([None, model.n_features_in_]))],
+    options={id(model): {'zipmap': False}},
+)
+
+with open(ONNX_MODEL_PATH, "wb") as f:
+    f.write(onx.SerializeToString())
+
+print(f"✅ Exported {type(model).__name__} to {ONNX_MODEL_PATH}")
@@ -1,29 +1,62 @@
 import os
-import json
+import base64
+import asyncio
+import atexit
+import logging
+import queue
 import threading
 import time
-from datetime import datetime
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any
+from logging.handlers import QueueHandler, QueueListener
 
 import firebase_admin
 from firebase_admin import credentials, db
 
 import joblib
+import msgpack
 import numpy as np
+import onnxruntime as ort
+import orjson
+from numba import njit
 
 from fastapi import FastAPI
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# ============================
+# 📝 Logging
+# ============================
+# Records are queued and written to stderr on the listener's own thread,
+# so the monitor and request paths never block on console I/O
+log_queue = queue.Queue(-1)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+log_listener = QueueListener(log_queue, log_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+logging.getLogger().addHandler(QueueHandler(log_queue))
+log = logging.getLogger("irrigation")
+log.setLevel(logging.INFO)
 
 # ============================
 # 🔑 Firebase Initialization
 # ============================
 firebase_key_json = os.environ["FIREBASE_KEY_JSON"]
-firebase_cred_dict = json.loads(firebase_key_json)
+firebase_cred_dict = orjson.loads(firebase_key_json)
 
 cred = credentials.Certificate(firebase_cred_dict)
 firebase_admin.initialize_app(cred, {
     'databaseURL': 'https://agri-hub-544be-default-rtdb.firebaseio.com'
 })
 
+# Devices that write base64(msgpack({h, t, s})) to sensorData/raw_packed
+USE_PACKED_SENSOR_DATA = os.environ.get("USE_PACKED_SENSOR_DATA", "false").lower() == "true"
+# Devices that write a hash of their readings to sensorData/_etag alongside the raw values
+USE_SENSOR_ETAG = os.environ.get("USE_SENSOR_ETAG", "false").lower() == "true"
+
 # ============================
 # 📦 Load Model + Artifacts
 # ============================
@@ -33,6 +66,217 @@ model = artifacts['model']
 scaler = artifacts['scaler']
 encoders = artifacts['encoders']
 
+# Location/season are fixed for this deployment, so encode them once
+DISTRICT_ENC = int(encoders['le_district'].transform(['Coimbatore'])[0])
+ZONE_ENC = int(encoders['le_zone'].transform(['Western Zone'])[0])
+SEASON_ENC = int(encoders['le_season'].transform(['southwest_monsoon'])[0])
+
+# ============================
+# ⚡ Compiled Feature Pipeline
+# ============================
+SCALER_MEAN = np.ascontiguousarray(scaler.mean_, dtype=np.float64)
+# Multiplying by the precomputed reciprocal avoids a division per feature
+SCALER_INV_SCALE = np.ascontiguousarray(1.0 / scaler.scale_, dtype=np.float64)
+
+RAINFALL_NEXT_1H_MM = 0.5
+
+# District, zone, season and rainfall never change, so their scaled values are
+# folded into a generated kernel that only does the per-reading arithmetic.
+# Scaling is (x - mean_) / scale_, computed in float64 and rounded to float32
+# on store, which is what sklearn feeds the trees.
+FEATURE_KERNEL_TEMPLATE = """
+def build_scaled_features(humidity, temperature, soil_moisture, hour, day_of_year, month, features):
+    features[0] = (soil_moisture - {m[0]!r}) * {s[0]!r}
+    features[1] = (temperature - {m[1]!r}) * {s[1]!r}
+    features[2] = (humidity - {m[2]!r}) * {s[2]!r}
+    features[3] = {rainfall!r}
+    features[4] = (hour - {m[4]!r}) * {s[4]!r}
+    features[5] = (day_of_year - {m[5]!r}) * {s[5]!r}
+    features[6] = (month - {m[6]!r}) * {s[6]!r}
+    features[7] = {district!r}
+    features[8] = {zone!r}
+    features[9] = {season!r}
+    features[10] = {heat_on!r} if (temperature > 35 and humidity < 50) else {heat_off!r}
+    features[11] = {drought_on!r} if soil_moisture < 30 else {drought_off!r}
+    features[12] = (soil_moisture * temperature - {m[12]!r}) * {s[12]!r}
+    features[13] = (humidity * {rain!r} - {m[13]!r}) * {s[13]!r}
+    return features
+"""
+
+def generate_feature_kernel(mean, inv_scale):
+    m = [float(v) for v in mean]
+    s = [float(v) for v in inv_scale]
+
+    def scaled(i, x):
+        return (float(x) - m[i]) * s[i]
+
+    drought_possible = RAINFALL_NEXT_1H_MM < 1  # drought_stress also requires rainfall < 1
+    source = FEATURE_KERNEL_TEMPLATE.format(
+        m=m, s=s, rain=RAINFALL_NEXT_1H_MM,
+        rainfall=scaled(3, RAINFALL_NEXT_1H_MM),
+        district=scaled(7, DISTRICT_ENC),
+        zone=scaled(8, ZONE_ENC),
+        season=scaled(9, SEASON_ENC),
+        heat_on=scaled(10, 1), heat_off=scaled(10, 0),
+        drought_on=scaled(11, 1 if drought_possible else 0), drought_off=scaled(11, 0),
+    )
+
+    namespace = {}
+    exec(compile(source, "<feature kernel>", "exec"), namespace)
+    # Generated code has no source file, so it cannot use Numba's on-disk cache
+    return njit('float32[:](float64,float64,float64,int64,int64,int64,float32[:])')(namespace['build_scaled_features'])
+
+build_scaled_features = generate_feature_kernel(SCALER_MEAN, SCALER_INV_SCALE)
+
+# Predictions run on both the monitor thread and FastAPI's threadpool,
+# so each thread writes into its own preallocated feature buffer
+_feature_buffers = threading.local()
+
+def feature_buffer():
+    buf = getattr(_feature_buffers, 'features', None)
+    if buf is None:
+        buf = _feature_buffers.features = np.empty(14, dtype=np.float32)
+    return buf
+
+# ============================
+# 🌲 Compiled Tree Ensemble
+# ============================
+def export_trees(model):
+    """Flatten the boosted regression trees into padded (n_trees, max_nodes) arrays."""
+    trees = model.estimators_.ravel()  # stage-major, one tree per class per stage
+    max_nodes = max(tree.tree_.node_count for tree in trees)
+
+    feature = np.zeros((len(trees), max_nodes), dtype=np.int32)
+    threshold = np.zeros((len(trees), max_nodes), dtype=np.float32)
+    left = np.full((len(trees), max_nodes), -1, dtype=np.int32)
+    right = np.full((len(trees), max_nodes), -1, dtype=np.int32)
+    value = np.zeros((len(trees), max_nodes), dtype=np.float64)
+
+    for i, tree in enumerate(trees):
+        t = tree.tree_
+        n = t.node_count
+        feature[i, :n] = t.feature
+        # Round down so float32 `x <= threshold` matches sklearn's float32-vs-float64 comparison exactly
+        thr32 = t.threshold.astype(np.float32)
+        threshold[i, :n] = np.where(thr32 > t.threshold, np.nextafter(thr32, np.float32(-np.inf)), thr32)
+        left[i, :n] = t.children_left
+        right[i, :n] = t.children_right
+        value[i, :n] = t.value[:, 0, 0]
+
+    return feature, threshold, left, right, value
+
+@njit(cache=True)
+def predict_forest(feature, threshold, left, right, value, baseline, learning_rate, x):
+    n_outputs = baseline.shape[0]
+    raw = baseline.copy()
+
+    for t in range(feature.shape[0]):
+        node = 0
+        while left[t, node] != -1:
+            if x[feature[t, node]] <= threshold[t, node]:
+                node = left[t, node]
+            else:
+                node = right[t, node]
+        raw[t % n_outputs] += learning_rate * value[t, node]
+
+    if n_outputs == 1:
+        return 1 if raw[0] >= 0 else 0
+    return np.argmax(raw)
+
+@njit(cache=True)
+def predict_forest_batch(feature, threshold, left, right, value, baseline, learning_rate, X):
+    encoded = np.empty(X.shape[0], dtype=np.int64)
+    for i in range(X.shape[0]):
+        encoded[i] = predict_forest(feature, threshold, left, right, value, baseline, learning_rate, X[i])
+    return encoded
+
+TREE_FEATURE, TREE_THRESHOLD, TREE_LEFT, TREE_RIGHT, TREE_VALUE = export_trees(model)
+# The init estimator (class priors) contributes the same raw score for every row.
+# export_trees and this line rely on sklearn internals (estimators_ layout, tree_.value
+# shape, _raw_predict_init), so scikit-learn is pinned in requirements.txt
+TREE_BASELINE = model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0]
+MODEL_CLASSES = model.classes_
+
+# ============================
+# 🧠 ONNX Runtime Session
+# ============================
+# Generated by export_onnx.py; falls back to the compiled trees above if missing
+ONNX_MODEL_PATH = "tamil_nadu_irrigation_model.onnx"
+onnx_session = None
+if os.path.exists(ONNX_MODEL_PATH):
+    onnx_session = ort.InferenceSession(ONNX_MODEL_PATH, providers=['CPUExecutionProvider'])
+    onnx_input = onnx_session.get_inputs()[0]
+    onnx_input_name = onnx_input.name
+    if onnx_input.shape[1] != model.n_features_in_:
+        raise RuntimeError(
+            f"{ONNX_MODEL_PATH} expects {onnx_input.shape[1]} features but {MODEL_PATH} has "
+            f"{model.n_features_in_}; rerun export_onnx.py"
+        )
+
+def check_finite(scaled_input):
+    # The trees send NaN/inf down an arbitrary branch instead of failing, so reject
+    # them (and float32 overflow from the engineered features) like check_array did
+    if not np.isfinite(scaled_input).all():
+        raise ValueError("Input X contains NaN or infinity.")
+
+def predict_class(scaled_input):
+    # Both backends score NaN/inf without complaint, so check before either one
+    check_finite(scaled_input)
+
+    if onnx_session is not None:
+        onnx_input = scaled_input.reshape(1, -1)
+        return int(onnx_session.run(['label'], {onnx_input_name: onnx_input})[0][0])
+
+    encoded = predict_forest(
+        TREE_FEATURE, TREE_THRESHOLD, TREE_LEFT, TREE_RIGHT, TREE_VALUE,
+        TREE_BASELINE, model.learning_rate, scaled_input
+    )
+    return int(MODEL_CLASSES[encoded])
+
+def predict_classes(scaled_rows):
+    """Score an (n, 14) float32 matrix in a single inference call."""
+    finite = np.isfinite(scaled_rows).all(axis=1)
+    if not finite.all():
+        raise ValueError(f"Input X contains NaN or infinity (rows {np.flatnonzero(~finite).tolist()}).")
+
+    if onnx_session is not None:
+        return onnx_session.run(['label'], {onnx_input_name: scaled_rows})[0].tolist()
+
+    encoded = predict_forest_batch(
+        TREE_FEATURE, TREE_THRESHOLD, TREE_LEFT, TREE_RIGHT, TREE_VALUE,
+        TREE_BASELINE, model.learning_rate, scaled_rows
+    )
+    return MODEL_CLASSES[encoded].tolist()
+
+# Warm up once so the JIT cost is paid at startup, not on the first request
+predict_class(build_scaled_features(0.0, 0.0, 0.0, 0, 1, 1, feature_buffer()))
+predict_classes(np.zeros((1, 14), dtype=np.float32))
+
+def check_onnx_matches_model():
+    """Fail fast if the .onnx export is stale, i.e. was not regenerated from the current .pkl."""
+    rng = np.random.default_rng(0)
+    probe_rows = np.empty((64, 14), dtype=np.float32)
+    for row in probe_rows:
+        build_scaled_features(
+            rng.uniform(10, 100), rng.uniform(15, 45), rng.uniform(0, 100),
+            int(rng.integers(0, 24)), int(rng.integers(1, 366)), int(rng.integers(1, 13)), row
+        )
+
+    onnx_labels = onnx_session.run(['label'], {onnx_input_name: probe_rows})[0]
+    tree_labels = MODEL_CLASSES[predict_forest_batch(
+        TREE_FEATURE, TREE_THRESHOLD, TREE_LEFT, TREE_RIGHT, TREE_VALUE,
+        TREE_BASELINE, model.learning_rate, probe_rows
+    )]
+    mismatches = int((onnx_labels != tree_labels).sum())
+    if mismatches:
+        raise RuntimeError(
+            f"{ONNX_MODEL_PATH} disagrees with {MODEL_PATH} on {mismatches}/{len(probe_rows)} "
+            f"probe rows; rerun export_onnx.py"
+        )
+
+if onnx_session is not None:
+    check_onnx_matches_model()
+
 # ============================
 # 🚀 FastAPI App
 # ============================
@@ -46,68 +290,183 @@ class SensorData(BaseModel):
     temperature: float
     soilMoisture: float
 
+# Batches are scored while holding predict_lock, which the monitor shares
+MAX_BATCH_ROWS = 256
+
+class BatchSensorData(BaseModel):
+    rows: list[SensorData] = Field(max_length=MAX_BATCH_ROWS)
+
+# Typed responses let FastAPI serialize straight to JSON bytes with Pydantic
+class PredictionResult(BaseModel):
+    irrigation_class: int
+    timestamp: str
+
+class PredictionError(BaseModel):
+    error: str
+
+class RootStatus(BaseModel):
+    message: str
+
+class TriggerResult(BaseModel):
+    status: str
+    result: PredictionResult | PredictionError
+    input_data: Any
+
+class TriggerError(BaseModel):
+    status: str
+    message: str
+
+class HealthyStatus(BaseModel):
+    status: str
+    firebase_connected: bool
+    current_sensor_data: Any
+    sensor_data_error: str | None = None
+    timestamp: str
+
+class UnhealthyStatus(BaseModel):
+    status: str
+    firebase_connected: bool
+    error: str
+    timestamp: str
+
+# ============================
+# 📥 Sensor Payload Decoding
+# ============================
+REQUIRED_SENSOR_FIELDS = ['humidity', 'temperature', 'soilMoisture']
+PACKED_SENSOR_KEYS = {'h': 'humidity', 't': 'temperature', 's': 'soilMoisture'}
+
+def unpack_sensor_data(blob):
+    """Decode a base64(msgpack) sensor blob into the usual field names."""
+    packed = msgpack.unpackb(base64.b64decode(blob), use_list=False)
+    if not isinstance(packed, dict):
+        raise ValueError(f"Packed sensor data is a {type(packed).__name__}, not a map")
+    return {name: packed[key] for key, name in PACKED_SENSOR_KEYS.items() if key in packed}
+
+def fetch_raw_sensor_data():
+    """Read the raw sensor node the devices write; packed blobs are returned undecoded."""
+    if USE_PACKED_SENSOR_DATA:
+        return db.reference("sensorData/raw_packed").get()
+    return db.reference("sensorData/raw").get()
+
+def decode_raw_sensor_data(raw):
+    if USE_PACKED_SENSOR_DATA:
+        return unpack_sensor_data(raw) if raw else None
+    return raw
+
+def read_raw_sensor_data():
+    """Fetch and decode the latest raw sensor reading."""
+    return decode_raw_sensor_data(fetch_raw_sensor_data())
+
+def sensor_data_from_fields(fields):
+    """Build SensorData from decoded fields; callers check REQUIRED_SENSOR_FIELDS first."""
+    if USE_PACKED_SENSOR_DATA:
+        return SensorData(**{field: fields[field] for field in REQUIRED_SENSOR_FIELDS})  # msgpack already yields native floats
+    return SensorData(
+        humidity=float(fields["humidity"]),
+        temperature=float(fields["temperature"]),
+        soilMoisture=float(fields["soilMoisture"])
+    )
+
+# ============================
+# 💾 Firebase Persistence
+# ============================
+# A single writer keeps RTDB updates in prediction order
+firebase_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="firebase-writer")
+
+def persist_prediction(irrigation_class, timestamp):
+    try:
+        db.reference('sensorData').update({
+            'prediction_class': irrigation_class,
+            'last_prediction_time': timestamp
+        })
+        log.info("✅ Prediction updated: Class %s at %s", irrigation_class, timestamp)
+    except Exception as e:
+        log.error("❌ Failed to save prediction (Class %s at %s): %s", irrigation_class, timestamp, e)
+
 # ============================
 # 🤖 Prediction Function
 # ============================
-def predict_irrigation(data: SensorData):
+# (second, hour, day_of_year, month) for the last second a prediction ran in;
+# replaced as a whole tuple so readers never see a half-updated entry
+calendar_cache = (None, 0, 0, 0)
+
+def calendar_fields(t):
+    """Return (hour, day_of_year, month) for epoch time t, recomputed at most once a second."""
+    global calendar_cache
+    cached = calendar_cache
+    second = int(t)
+    if cached[0] != second:
+        now = datetime.fromtimestamp(second)
+        day_of_year = now.toordinal() - date(now.year, 1, 1).toordinal() + 1
+        cached = calendar_cache = (second, now.hour, day_of_year, now.month)
+    return cached[1], cached[2], cached[3]
+
+# One prediction at a time: the monitor and the API routes can race on the same reading
+predict_lock = threading.Lock()
+last_prediction = {"key": None, "result": None}
+
+def predict_irrigation(data: SensorData, skip_duplicate=False):
     try:
-        now = datetime.now()
-        full_input = {
-            'soil_moisture_percent': data.soilMoisture,
-            'temperature_celsius': data.temperature,
-            'humidity_percent': data.humidity,
-            'rainfall_mm_prediction_next_1h': 0.5,
-            'hour': now.hour,
-            'day_of_year': now.timetuple().tm_yday,
-            'month': now.month,
-            'district': 'Coimbatore',
-            'zone': 'Western Zone',
-            'season': 'southwest_monsoon'
-        }
+        key = (data.humidity, data.temperature, data.soilMoisture)
 
-        # Encode categorical features
-        district_enc = encoders['le_district'].transform([full_input['district']])[0]
-        zone_enc = encoders['le_zone'].transform([full_input['zone']])[0]
-        season_enc = encoders['le_season'].transform([full_input['season']])[0]
-
-        # Extra engineered features
-        heat_stress = int(full_input['temperature_celsius'] > 35 and full_input['humidity_percent'] < 50)
-        drought_stress = int(full_input['soil_moisture_percent'] < 30 and full_input['rainfall_mm_prediction_next_1h'] < 1)
-        soil_temp_interaction = full_input['soil_moisture_percent'] * full_input['temperature_celsius']
-        humidity_rain_interaction = full_input['humidity_percent'] * full_input['rainfall_mm_prediction_next_1h']
-
-        # Build feature vector
-        feature_vector = np.array([[
-            full_input['soil_moisture_percent'],
-            full_input['temperature_celsius'],
-            full_input['humidity_percent'],
-            full_input['rainfall_mm_prediction_next_1h'],
-            full_input['hour'],
-            full_input['day_of_year'],
-            full_input['month'],
-            district_enc,
-            zone_enc,
-            season_enc,
-            heat_stress,
-            drought_stress,
-            soil_temp_interaction,
-            humidity_rain_interaction
-        ]])
-
-        # Scale & predict
-        scaled_input = scaler.transform(feature_vector)
-        irrigation_class = int(model.predict(scaled_input)[0])
-
-        # Save result to Firebase
-        timestamp = datetime.now().isoformat()
-        db.reference('sensorData/prediction_class').set(irrigation_class)
-        db.reference('sensorData/last_prediction_time').set(timestamp)
-        
-        print(f"✅ Prediction updated: Class {irrigation_class} at {timestamp}")
+        with predict_lock:
+            # Reuse the result if these exact readings were just scored (e.g. by /trigger-prediction)
+            if skip_duplicate and key == last_prediction["key"]:
+                return last_prediction["result"]
+
+            t = time.time()
+            timestamp = datetime.fromtimestamp(t).isoformat()
+            hour, day_of_year, month = calendar_fields(t)
+
+            # Build & scale feature vector
+            scaled_input = build_scaled_features(
+                data.humidity, data.temperature, data.soilMoisture,
+                hour, day_of_year, month, feature_buffer()
+            )
+
+            # Predict
+            irrigation_class = predict_class(scaled_input)
+            result = {"irrigation_class": irrigation_class, "timestamp": timestamp}
+            last_prediction["key"] = key
+            last_prediction["result"] = result
 
-        return {"irrigation_class": irrigation_class, "timestamp": timestamp}
+            # Save result to Firebase in the background; the caller gets the prediction right away
+            firebase_writer.submit(persist_prediction, irrigation_class, timestamp)
+
+        return result
     except Exception as e:
-        print(f"❌ Prediction error: {str(e)}")
+        log.error("❌ Prediction error: %s", e)
+        return {"error": str(e)}
+
+def predict_irrigation_batch(rows):
+    try:
+        with predict_lock:
+            if not rows:
+                return []
+
+            t = time.time()
+            timestamp = datetime.fromtimestamp(t).isoformat()
+            hour, day_of_year, month = calendar_fields(t)
+
+            # Build & scale all rows, then score them in one call
+            scaled_rows = np.empty((len(rows), 14), dtype=np.float32)
+            for i, data in enumerate(rows):
+                build_scaled_features(
+                    data.humidity, data.temperature, data.soilMoisture,
+                    hour, day_of_year, month, scaled_rows[i]
+                )
+            irrigation_classes = predict_classes(scaled_rows)
+            results = [{"irrigation_class": c, "timestamp": timestamp} for c in irrigation_classes]
+
+            # The last row is the most recent reading, so it is the one saved to Firebase
+            last = rows[-1]
+            last_prediction["key"] = (last.humidity, last.temperature, last.soilMoisture)
+            last_prediction["result"] = results[-1]
+            firebase_writer.submit(persist_prediction, results[-1]["irrigation_class"], timestamp)
+
+        return results
+    except Exception as e:
+        log.error("❌ Batch prediction error: %s", e)
         return {"error": str(e)}
 
 # ============================
@@ -116,27 +475,24 @@ def predict_irrigation(data: SensorData):
 
 # Root route for Render health check
 @app.get("/")
-def root():
+def root() -> RootStatus:
     return {"message": "🌱 Irrigation backend is running"}
 
 # Manual prediction endpoint
 @app.post("/predict")
-def predict_route(data: SensorData):
-    return predict_irrigation(data)
+async def predict_route(data: SensorData) -> PredictionResult | PredictionError:
+    return await asyncio.to_thread(predict_irrigation, data)
+
+# Score many readings in one inference call
+@app.post("/predict/batch")
+async def predict_batch_route(batch: BatchSensorData) -> list[PredictionResult] | PredictionError:
+    return await asyncio.to_thread(predict_irrigation_batch, batch.rows)
 
 # Health check
 @app.get("/health")
-def health_check():
+async def health_check() -> HealthyStatus | UnhealthyStatus:
     try:
-        test_ref = db.reference("sensorData/raw")
-        current_data = test_ref.get()
-        
-        return {
-            "status": "healthy",
-            "firebase_connected": True,
-            "current_sensor_data": current_data,
-            "timestamp": datetime.now().isoformat()
-        }
+        raw_data = await asyncio.to_thread(fetch_raw_sensor_data)
     except Exception as e:
         return {
             "status": "unhealthy",
@@ -145,20 +501,35 @@ def health_check():
             "timestamp": datetime.now().isoformat()
         }
 
+    # Firebase answered; a bad payload is a device problem, not a connectivity one
+    sensor_data_error = None
+    try:
+        current_data = decode_raw_sensor_data(raw_data)
+    except Exception as e:
+        current_data = None
+        sensor_data_error = f"Could not decode sensor data: {e}"
+
+    return {
+        "status": "healthy",
+        "firebase_connected": True,
+        "current_sensor_data": current_data,
+        "sensor_data_error": sensor_data_error,
+        "timestamp": datetime.now().isoformat()
+    }
+
 # Manual trigger from Firebase
 @app.post("/trigger-prediction")
-def trigger_prediction():
+async def trigger_prediction() -> TriggerResult | TriggerError:
     try:
-        ref = db.reference("sensorData/raw")
-        current_data = ref.get()
+        current_data = await asyncio.to_thread(read_raw_sensor_data)
         
         if current_data:
-            data = SensorData(
-                humidity=float(current_data.get("humidity", 0.0)),
-                temperature=float(current_data.get("temperature", 0.0)),
-                soilMoisture=float(current_data.get("soilMoisture", 0.0))
-            )
-            result = predict_irrigation(data)
+            missing_fields = [f for f in REQUIRED_SENSOR_FIELDS if f not in current_data]
+            if missing_fields:
+                return {"status": "error", "message": f"Missing required fields: {missing_fields}"}
+
+            data = sensor_data_from_fields(current_data)
+            result = await asyncio.to_thread(predict_irrigation, data)
             return {"status": "success", "result": result, "input_data": current_data}
         else:
             return {"status": "error", "message": "No sensor data found"}
@@ -169,60 +540,155 @@ def trigger_prediction():
 # ============================
 # 🔄 Background Firebase Monitor
 # ============================
+# Sensor changes arriving within this window are coalesced; only the latest is scored
+MONITOR_BATCH_WINDOW = 0.2  # seconds
+
+monitor_stop = threading.Event()
+sensor_listener = None
+
+def apply_sensor_event(current, event):
+    """Merge a put/patch stream event into the local copy of sensorData's top-level fields."""
+    path = event.path.strip('/')
+    if '/' in path:
+        return  # nested nodes (e.g. sensorData/raw/...) are not read by the monitor
+
+    if not path:
+        if event.event_type == 'put':
+            current.clear()
+        changes = event.data if isinstance(event.data, dict) else {}
+    else:
+        changes = {path: event.data}
+
+    for key, value in changes.items():
+        if value is None:
+            current.pop(key, None)
+        else:
+            current[key] = value
+
 def monitor_firebase_sensor_data():
-    last_values = None
+    global sensor_listener
+    current = {}
+    last_readings = None
+    last_etag = None
     consecutive_errors = 0
-    max_errors = 5
+    pending = {"data": None}
+    pending_lock = threading.Lock()
+
+    def flush_pending_reading():
+        with pending_lock:
+            data = pending["data"]
+            pending["data"] = None
+        result = predict_irrigation(data, skip_duplicate=True)
+        log.info("✅ Prediction result: %s", result)
+
+    def process_sensor_fields(sensor_fields):
+        nonlocal last_readings
+        if not sensor_fields:
+            log.warning("⚠️  No sensor data found in Firebase")
+            return
+
+        # Our own prediction writes land in sensorData too, so only react to the sensor fields
+        readings = (sensor_fields.get('humidity'), sensor_fields.get('temperature'), sensor_fields.get('soilMoisture'))
+        if readings == last_readings:
+            log.info("📊 No change detected in sensor data")
+            return
+
+        log.info("🔔 Detected change in sensor data!")
+        log.info("   Previous: %s", last_readings)
+        log.info("   Current:  %s", readings)
 
-    print("🔄 Starting Firebase monitoring...")
+        if all(field in sensor_fields for field in REQUIRED_SENSOR_FIELDS):
+            try:
+                data = sensor_data_from_fields(sensor_fields)
+                # Only the latest reading's class is saved, so newer readings replace older ones
+                with pending_lock:
+                    if pending["data"] is None:
+                        flush_timer = threading.Timer(MONITOR_BATCH_WINDOW, flush_pending_reading)
+                        flush_timer.daemon = True
+                        flush_timer.start()
+                    pending["data"] = data
+                last_readings = readings
+            except (ValueError, TypeError) as e:
+                log.error("❌ Data validation error: %s", e)
+                log.error("   Raw data: %s", sensor_fields)
+        else:
+            missing_fields = [f for f in REQUIRED_SENSOR_FIELDS if f not in sensor_fields]
+            log.error("❌ Missing required fields: %s", missing_fields)
+            log.error("   Available fields: %s", list(sensor_fields.keys()))
 
-    while True:
+    # Exceptions in these callbacks would kill the SDK's listener thread, so they are logged instead
+    def on_sensor_event(event):
         try:
-            ref = db.reference("sensorData")
-            current = ref.get()
-            print(f"📊 Current sensor data: {current}")
-            
-            if current is not None:
-                if last_values is None or current != last_values or not last_values:
-                    print("🔔 Detected change in sensor data!")
-                    print(f"   Previous: {last_values}")
-                    print(f"   Current:  {current}")
-                    
-                    required_fields = ['humidity', 'temperature', 'soilMoisture']
-                    if all(field in current for field in required_fields):
-                        try:
-                            data = SensorData(
-                                humidity=float(current.get("humidity", 0.0)),
-                                temperature=float(current.get("temperature", 0.0)),
-                                soilMoisture=float(current.get("soilMoisture", 0.0))
-                            )
-                            result = predict_irrigation(data)
-                            print(f"✅ Prediction result: {result}")
-                            last_values = current.copy()
-                            consecutive_errors = 0
-                        except (ValueError, TypeError) as e:
-                            print(f"❌ Data validation error: {e}")
-                            print(f"   Raw data: {current}")
-                    else:
-                        missing_fields = [f for f in required_fields if f not in current]
-                        print(f"❌ Missing required fields: {missing_fields}")
-                        print(f"   Available fields: {list(current.keys())}")
-                else:
-                    print("📊 No change detected in sensor data")
+            apply_sensor_event(current, event)
+            log.info("📊 Sensor data event (%s %s): %s", event.event_type, event.path, event.data)
+
+            sensor_fields = current
+            if USE_PACKED_SENSOR_DATA:
+                sensor_fields = unpack_sensor_data(current['raw_packed']) if current.get('raw_packed') else {}
+            process_sensor_fields(sensor_fields)
+        except Exception as e:
+            log.error("❌ Error while handling sensor data event: %s", e)
+
+    def on_etag_event(event):
+        nonlocal last_etag
+        try:
+            log.info("📊 Sensor etag event: %s", event.data)
+            if event.data is None or event.data == last_etag:
+                log.info("📊 No change detected in sensor data")
+                return
+
+            # Only fetch the readings when the device reports a new hash
+            process_sensor_fields(read_raw_sensor_data() or {})
+            last_etag = event.data
+        except Exception as e:
+            log.error("❌ Error while handling sensor etag event: %s", e)
+
+    log.info("🔄 Starting Firebase monitoring...")
+
+    while not monitor_stop.is_set():
+        try:
+            if USE_SENSOR_ETAG:
+                sensor_listener = db.reference("sensorData/_etag").listen(on_etag_event)
             else:
-                print("⚠️  No sensor data found in Firebase")
-                
+                sensor_listener = db.reference("sensorData").listen(on_sensor_event)
+            consecutive_errors = 0
+            log.info("👂 Listening for sensor data changes...")
+
+            # The SDK retries dropped connections itself; block until the stream ends for good.
+            # firebase-admin has no public way to wait on a listener, so this uses
+            # ListenerRegistration._thread (version pinned in requirements.txt)
+            listener_thread = getattr(sensor_listener, '_thread', None)
+            if listener_thread is None:
+                log.warning("⚠️  firebase-admin no longer exposes the listener thread; dropped streams won't be reconnected")
+                monitor_stop.wait()
+            else:
+                listener_thread.join()
+            if not monitor_stop.is_set():
+                log.warning("⚠️  Sensor data stream closed, reconnecting...")
         except Exception as e:
             consecutive_errors += 1
-            print(f"❌ Error while monitoring sensor data (attempt {consecutive_errors}): {e}")
-            if consecutive_errors >= max_errors:
-                print(f"💥 Too many consecutive errors ({max_errors}). Stopping monitor.")
-                break
+            log.error("❌ Error while listening for sensor data (attempt %d): %s", consecutive_errors, e)
 
-        time.sleep(5)
+        # Exponential backoff with jitter; never give up, Firebase outages are usually transient
+        delay = min(60, 5 * 2 ** min(consecutive_errors, 4)) + random.uniform(0, 1)
+        if consecutive_errors:
+            log.info("⏳ Retrying in %.1fs...", delay)
+        monitor_stop.wait(delay)
 
 # Start monitoring on startup
 @app.on_event("startup")
 def start_firebase_monitor():
-    print("🚀 Starting Firebase monitoring...")
+    log.info("🚀 Starting Firebase monitoring...")
     threading.Thread(target=monitor_firebase_sensor_data, daemon=True).start()
+
+# The SDK's listener thread is not a daemon, so close the stream on shutdown
+@app.on_event("shutdown")
+def stop_firebase_monitor():
+    monitor_stop.set()
+    if sensor_listener is not None:
+        sensor_listener.close()
+
+# Flush pending prediction writes before exiting
+@app.on_event("shutdown")
+def stop_firebase_writer():
+    firebase_writer.shutdown(wait=True)